@@ -5,8 +5,12 @@ um modelo de linguagem natural, e renomeia os arquivos com base na data do pagam
 Bibliotecas usadas:
 - PyMuPDF para manipulação de arquivos PDF
 - pytesseract e Pillow para OCR em imagens
+- tesserocr (opcional) para OCR em processo, sem executar o binário tesseract a cada imagem
+- OpenCV (opcional) para pré-processar imagens antes do OCR
+- pyahocorasick (opcional) para localizar os códigos do CSV em uma única passada no texto
+- orjson (opcional) para decodificar as respostas JSON do LLM
 - openai para interação com o modelo de linguagem natural
-- pandas para manipulação de dados tabulares
+- csv para leitura da base de códigos de contas
 - re para expressões regulares
 - os para manipulação de arquivos
 
@@ -19,36 +23,79 @@ Funções:
 - extract_content: Extrai o conteúdo de um arquivo (PDF ou imagem)
 - extract_text_from_pdf: Extrai texto de um arquivo PDF
 - extract_text_from_image: Extrai texto de uma imagem
-- enviar_para_llm: Envia texto para um modelo de linguagem e retorna a resposta
+- extract_text_from_images: Extrai texto de várias imagens em uma única execução do Tesseract
+- enviar_para_llm_async: Envia texto para um modelo de linguagem e retorna a resposta
 - carregar_base_contas: Carrega e normaliza o CSV de códigos de contas
 - normalizar_codigos: Normaliza a lista de códigos do CSV
-- classifica_boleto: Classifica o boleto com base nos códigos presentes no dataframe
+- montar_regras: Converte os registros de contas nas regras de classificação
+- classifica_boleto: Classifica o boleto com base nos códigos das regras
+- processar_arquivos: Processa os arquivos concorrentemente (asyncio)
+- processar_arquivos_lote: Processa os arquivos em um único lote pela Batch API
 
 Pre requisitos:
     pymupdf>=1.26.0      # PDF processing (fitz)
     pytesseract>=0.3.10  # OCR functionality
     pillow>=10.0.0       # Image processing
-    pandas>=2.0.0        # Data manipulation
     openai>=1.0.0        # LLM client
+    tenacity>=8.0.0      # Retry com backoff nas chamadas ao LLM
+    tesserocr>=2.6.0     # Opcional: OCR em processo (mais rápido que pytesseract)
+    opencv-python-headless  # Opcional: pré-processamento de imagens (--preprocess)
+    pyahocorasick        # Opcional: classificação com autômato Aho-Corasick
+    orjson               # Opcional: decodificação JSON mais rápida
 """
 
 import os
+# Cada worker de OCR usa uma única thread OpenMP; o paralelismo vem do ThreadPoolExecutor.
+# Precisa ser definido antes de o Tesseract ser carregado.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
 import re
+import asyncio
 import json
 import ast
+import hashlib
+import shelve
+import math
+import mmap
 import argparse
 import logging
+import time
 from datetime import datetime
 import fitz   # PyMuPDF
 import pytesseract
 from PIL import Image
-import pandas as pd
-from openai import OpenAI
+from openai import (
+    OpenAI, AsyncOpenAI, APIStatusError, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+)
+from openai.types.chat import ChatCompletion
+from tenacity import retry, wait_random_exponential, stop_after_attempt, retry_if_exception_type, before_sleep_log
 from pathlib import Path
 import csv
 import tempfile
 import atexit
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from tesserocr import PyTessBaseAPI
+except ImportError:  # tesserocr é opcional; sem ele o OCR usa o binário tesseract via pytesseract
+    PyTessBaseAPI = None
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele usa-se o módulo json da biblioteca padrão
+    orjson = None
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick é opcional; sem ele a classificação usa busca por substring
+    ahocorasick = None
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:  # OpenCV é opcional; só é necessário com --preprocess
+    cv2 = None
 
 
 # Configuração de logging
@@ -62,6 +109,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Expressões regulares usadas a cada arquivo, compiladas uma única vez
+_RE_THINK = re.compile(r'<think>[\s\S]*?</think>', re.IGNORECASE)  # blocos de raciocínio
+_RE_ESC_UNDER = re.compile(r'\\_')  # underscore escapado (\_)
+_RE_JSON_BLOCK = re.compile(r"```json\s*(\{[\s\S]*?\})\s*```")  # JSON em bloco markdown
+
+# Clientes OpenAI compartilhados entre as chamadas (criados sob demanda)
+_CLIENT = None
+_ASYNC_CLIENT = None
+
+# API do Tesseract em processo (tesserocr), criada sob demanda. Não é reentrante,
+# por isso cada thread de OCR mantém a sua própria instância.
+_TESS_LOCAL = threading.local()
+
+# O PyMuPDF (fitz) não é thread-safe: toda chamada a ele passa por este lock
+_FITZ_LOCK = threading.Lock()
+
 # Lista global de arquivos temporários para limpeza
 _temp_files = []
 _temp_dirs = []
@@ -90,12 +153,20 @@ atexit.register(limpar_arquivos_temporarios)
 
 def verificar_dependencias():
     """Verifica se todas as dependências estão disponíveis."""
-    try:
-        import pytesseract
-        pytesseract.get_tesseract_version()
-        logger.info("Tesseract OCR encontrado e funcionando")
-    except Exception as e:
-        raise RuntimeError(f"Tesseract OCR não encontrado ou não funcional: {e}")
+    if PyTessBaseAPI is not None:
+        logger.info("tesserocr disponível - OCR será executado em processo")
+    else:
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+            logger.info("Tesseract OCR encontrado e funcionando")
+        except Exception as e:
+            raise RuntimeError(f"Tesseract OCR não encontrado ou não funcional: {e}")
+    
+    if CONFIG['preprocessar_ocr']:
+        if cv2 is None:
+            raise RuntimeError("OpenCV não encontrado (necessário para --preprocess). Instale com: pip install opencv-python-headless")
+        logger.info("OpenCV disponível - imagens serão pré-processadas antes do OCR")
     
     try:
         import fitz
@@ -117,7 +188,17 @@ def obter_configuracao():
         'base_url_llm': os.getenv('BOLETO_BASE_URL_LLM', 'http://localhost:11434/v1'),
         'api_key_llm': os.getenv('BOLETO_API_KEY_LLM', 'ollama'),
         'tesseract_lang': os.getenv('BOLETO_TESSERACT_LANG', 'por'),
-        'log_level': os.getenv('BOLETO_LOG_LEVEL', 'INFO')
+        'log_level': os.getenv('BOLETO_LOG_LEVEL', 'INFO'),
+        'preprocessar_ocr': os.getenv('BOLETO_PREPROCESS_OCR', '').strip().lower() in ('1', 'true', 'sim', 'yes'),
+        # Pré-filtros para descartar arquivos que dificilmente são comprovantes (0 desativa o filtro)
+        'tamanho_min_arquivo': int(os.getenv('BOLETO_TAMANHO_MIN_ARQUIVO', '512')),
+        'tamanho_max_arquivo': int(os.getenv('BOLETO_TAMANHO_MAX_ARQUIVO', '20000000')),
+        'max_paginas_pdf': int(os.getenv('BOLETO_MAX_PAGINAS_PDF', '10')),
+        'dimensao_min_imagem': int(os.getenv('BOLETO_DIMENSAO_MIN_IMAGEM', '100')),
+        # Limite de caracteres do texto enviado ao LLM, após a compactação
+        'max_caracteres_contexto': int(os.getenv('BOLETO_MAX_CONTEXT_CHARS', '4000')),
+        # Id de um lote já enviado à Batch API, para retomar a consulta em vez de enviar outro
+        'id_lote': os.getenv('BOLETO_BATCH_ID', ''),
     }
     
     # Ajustar nível de log
@@ -127,13 +208,14 @@ def obter_configuracao():
     return config
 
 
-def validar_dataframe(df):
-    """Valida se o DataFrame tem as colunas necessárias."""
+def validar_registros(registros):
+    """Valida se os registros do CSV têm as chaves necessárias."""
     required_columns = ['codigos', 'nome_pagamento']
-    missing = [col for col in required_columns if col not in df.columns]
-    if missing:
-        raise ValueError(f"Colunas faltando no CSV: {missing}")
-    logger.info(f"DataFrame validado com {len(df)} registros")
+    for registro in registros:
+        missing = [col for col in required_columns if col not in registro]
+        if missing:
+            raise ValueError(f"Colunas faltando no CSV: {missing}")
+    logger.info(f"Registros validados: {len(registros)}")
 
 
 def validar_data(data_str):
@@ -158,7 +240,8 @@ texto fornecido, sem inventar, com o conteúdo comprovantes de pagamento. Siga a
 4. O conteúdo do comprovante será colocado entre quatro backticks
 5. A resposta deve ser em formato JSON, com as chaves data_pagamento, contendo a data em formato \
 'yyyy-mm-aa' e valor_pagamento, contendo o valor pago em formato ponto flutuante. A resposta deve conter somente o JSON, mais nada.
-6. Caso não seja possível extrair as informações, responda apenas 'erro'
+6. Caso não seja possível extrair as informações, responda apenas 'erro' ou, se a resposta \
+precisar ser um objeto JSON, {{"erro": true}}
 
 Exemplo de resposta1:
 
@@ -219,27 +302,89 @@ def carregar_base_contas(path_csv):
     if not registros:
         raise ValueError("Nenhum registro válido encontrado no CSV.")
 
-    df = pd.DataFrame(registros, columns=['nome_pagamento', 'codigos'])
-    logger.info(f"CSV carregado com {len(df)} registros antes da validação")
-    return df
+    logger.info(f"CSV carregado com {len(registros)} registros antes da validação")
+    return registros
+
+
+# Extensões de arquivo aceitas para processamento
+_ALLOWED_EXT = ('.pdf', '.jpeg', '.jpg', '.png')
+
+
+def _tem_prefixo_data(nome):
+    """Indica se o nome começa com uma data YYYY-MM-DD (arquivo já renomeado)."""
+    return (
+        len(nome) >= 10 and nome[4] == '-' and nome[7] == '-'
+        and nome[:4].isdecimal() and nome[5:7].isdecimal() and nome[8:10].isdecimal()
+    )
+
+
+def _motivo_descarte(entrada, nome_lower):
+    """Aplica pré-filtros baratos (tamanho, páginas, dimensões) a um arquivo candidato.
+
+    Retorna o motivo do descarte, ou None se o arquivo deve ser processado. Arquivos que não
+    puderem ser inspecionados não são descartados, para que o erro apareça no processamento.
+    """
+    try:
+        tamanho = entrada.stat().st_size
+    except OSError as e:
+        logger.debug("Não foi possível obter o tamanho de %s para os pré-filtros: %s", entrada.path, e)
+        return None
+    tamanho_min = CONFIG['tamanho_min_arquivo']
+    tamanho_max = CONFIG['tamanho_max_arquivo']
+    if tamanho_min and tamanho < tamanho_min:
+        return f"tamanho {tamanho} bytes abaixo do mínimo de {tamanho_min}"
+    if tamanho_max and tamanho > tamanho_max:
+        return f"tamanho {tamanho} bytes acima do máximo de {tamanho_max}"
+
+    try:
+        if nome_lower.endswith('.pdf'):
+            max_paginas = CONFIG['max_paginas_pdf']
+            if max_paginas:
+                with _FITZ_LOCK, fitz.open(entrada.path) as doc:
+                    paginas = doc.page_count
+                if paginas > max_paginas:
+                    return f"{paginas} páginas, acima do máximo de {max_paginas}"
+        else:
+            dimensao_min = CONFIG['dimensao_min_imagem']
+            if dimensao_min:
+                # Image.open lê apenas o cabeçalho; os pixels não são decodificados
+                with Image.open(entrada.path) as image:
+                    largura, altura = image.size
+                if largura < dimensao_min or altura < dimensao_min:
+                    return f"dimensões {largura}x{altura} abaixo do mínimo de {dimensao_min}px"
+    except Exception as e:
+        logger.debug("Não foi possível inspecionar %s para os pré-filtros: %s", entrada.path, e)
+
+    return None
 
 
 def listar_arquivos(diretorio):
-    """Lista arquivos válidos em um diretório, filtrando por data no nome e extensões permitidas."""
-    regex_data = re.compile(r'^\d{4}-\d{2}-\d{2}')
+    """Lista arquivos válidos em um diretório, filtrando por data no nome e extensões permitidas.
+
+    Arquivos reprovados nos pré-filtros de tamanho, número de páginas ou dimensões
+    (ver _motivo_descarte) são ignorados antes das etapas de OCR e LLM.
+    """
     arquivos_validos = []
+    total = 0
 
     try:
-        arquivos_dir = os.listdir(diretorio)
-        logger.info(f"Encontrados {len(arquivos_dir)} arquivos no diretório {diretorio}")
+        with os.scandir(diretorio) as entradas:
+            for entrada in entradas:
+                total += 1
+                nome = entrada.name
+                nome_lower = nome.lower()
+                if (nome_lower.endswith(_ALLOWED_EXT) and not _tem_prefixo_data(nome)
+                        and 'naoidentificado' not in nome_lower and entrada.is_file()):
+                    motivo = _motivo_descarte(entrada, nome_lower)
+                    if motivo:
+                        logger.warning(f"Arquivo ignorado: {nome} ({motivo})")
+                        continue
+                    arquivos_validos.append(nome)
+        logger.info(f"Encontrados {total} arquivos no diretório {diretorio}")
     except OSError as e:
         logger.error(f"Erro ao listar diretório {diretorio}: {e}")
         raise
 
-    for arquivo in arquivos_dir:
-        if arquivo.lower().endswith(('.pdf', '.jpeg', '.jpg', '.png')) and not regex_data.match(arquivo) and 'naoidentificado' not in arquivo.lower():
-            arquivos_validos.append(arquivo)
-
     logger.info(f"Encontrados {len(arquivos_validos)} arquivos válidos para processamento")
     return arquivos_validos
 
@@ -264,8 +409,6 @@ def extract_content(file_path):
 
 def extract_text_from_pdf(pdf_path):
     """Extrai texto de um arquivo PDF."""
-    text = ""
-    
     # Validação de entrada
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"Arquivo PDF não encontrado: {pdf_path}")
@@ -274,17 +417,19 @@ def extract_text_from_pdf(pdf_path):
         raise ValueError(f"Caminho não é um arquivo: {pdf_path}")
     
     try:
-        with fitz.open(pdf_path) as doc:
-            logger.debug(f"PDF aberto com {len(doc)} páginas")
+        with _FITZ_LOCK, fitz.open(pdf_path) as doc:
+            logger.debug("PDF aberto com %d páginas", len(doc))
             
             if len(doc) == 0:
                 raise ValueError(f"PDF vazio (0 páginas): {pdf_path}")
             
-            for page_num, page in enumerate(doc):
-                page_text = page.get_text()
-                text += page_text
-                logger.debug(f"Página {page_num + 1}: {len(page_text)} caracteres extraídos")
+            partes = [page.get_text("text") for page in doc]
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                for page_num, page_text in enumerate(partes):
+                    logger.debug("Página %d: %d caracteres extraídos", page_num + 1, len(page_text))
         
+        text = "".join(partes)
         logger.info(f"Texto extraído do PDF: {len(text)} caracteres totais.")
         return text
     except Exception as e:
@@ -292,6 +437,41 @@ def extract_text_from_pdf(pdf_path):
         raise
 
 
+def _get_tess_api():
+    """Retorna a API tesserocr da thread atual, carregando o modelo de idioma na primeira chamada."""
+    api = getattr(_TESS_LOCAL, 'api', None)
+    if api is None:
+        api = PyTessBaseAPI(lang=CONFIG['tesseract_lang'])
+        atexit.register(api.End)
+        _TESS_LOCAL.api = api
+        logger.debug(f"API tesserocr inicializada (idioma: {CONFIG['tesseract_lang']})")
+    return api
+
+
+def _mmap(path):
+    """Mapeia um arquivo em memória somente para leitura."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+        os.close(fd)
+
+
+def preprocessar_imagem(image_path):
+    """Converte a imagem para tons de cinza e binariza com limiar adaptativo (OpenCV).
+
+    Uma imagem bi-level reduz o trabalho de binarização e análise de layout do Tesseract
+    e costuma melhorar a precisão do OCR em comprovantes fotografados.
+    """
+    # Decodifica direto do arquivo mapeado em memória, sem copiar os bytes para um buffer Python
+    with _mmap(image_path) as mm:
+        img = cv2.imdecode(np.frombuffer(mm, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError(f"Não foi possível ler a imagem: {image_path}")
+    binaria = cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10)
+    return Image.fromarray(binaria)
+
+
 def extract_text_from_image(image_path):
     """Extrai texto de uma imagem usando OCR."""
     # Validação de entrada
@@ -301,71 +481,213 @@ def extract_text_from_image(image_path):
     if not os.path.isfile(image_path):
         raise ValueError(f"Caminho não é um arquivo: {image_path}")
     
+    if os.path.getsize(image_path) == 0:
+        raise ValueError(f"Arquivo de imagem vazio: {image_path}")
+    
     try:
-        image = Image.open(image_path)
-        logger.debug(f"Imagem carregada: {image.size}")
-        
-        # Validar dimensões da imagem
-        if image.size[0] == 0 or image.size[1] == 0:
-            raise ValueError(f"Imagem com dimensões inválidas: {image.size}")
-        
-        text = pytesseract.image_to_string(image, lang=CONFIG['tesseract_lang'])
+        if CONFIG['preprocessar_ocr']:
+            image = preprocessar_imagem(image_path)
+            logger.debug("Imagem carregada: %s", image.size)
+            
+            # Validar dimensões da imagem
+            if image.size[0] == 0 or image.size[1] == 0:
+                raise ValueError(f"Imagem com dimensões inválidas: {image.size}")
+            
+            if PyTessBaseAPI is not None:
+                api = _get_tess_api()
+                api.SetImage(image)
+                text = api.GetUTF8Text()
+            else:
+                text = pytesseract.image_to_string(image, lang=CONFIG['tesseract_lang'])
+            
+            # Fechar imagem para liberar recurso
+            image.close()
+        else:
+            # Sem pré-processamento, o Tesseract decodifica a imagem direto do disco
+            if PyTessBaseAPI is not None:
+                api = _get_tess_api()
+                api.SetImageFile(str(image_path))
+                text = api.GetUTF8Text()
+            else:
+                text = pytesseract.image_to_string(str(image_path), lang=CONFIG['tesseract_lang'])
         logger.info(f"OCR concluído: {len(text)} caracteres extraídos de {image_path}")
         
-        # Fechar imagem para liberar recurso
-        image.close()
-        
         return text
     except Exception as e:
         logger.error(f"Erro no OCR da imagem {image_path}: {e}")
         raise
 
 
-def enviar_para_llm(texto, prompt, modelo=None, timeout=60):
-    """Envia texto para um modelo de linguagem e retorna a resposta formatada."""
-    if modelo is None:
-        modelo = CONFIG['modelo_llm']
+def extract_text_from_images(image_paths):
+    """Extrai texto de várias imagens em uma única execução do Tesseract.
+
+    Os caminhos são gravados em um arquivo de lista, de modo que o Tesseract carrega o modelo
+    de idioma uma única vez. Retorna um dicionário caminho -> texto. Levanta ValueError se a
+    saída não puder ser mapeada de volta para as imagens (uma página por imagem).
+    """
+    fd, caminho_lista = tempfile.mkstemp(prefix='boleto_ocr_', suffix='.txt')
+    _temp_files.append(caminho_lista)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(str(path) for path in image_paths))
+
+    logger.info(f"OCR em lote de {len(image_paths)} imagens")
+    try:
+        texto = pytesseract.image_to_string(caminho_lista, lang=CONFIG['tesseract_lang'])
+    except Exception as e:
+        logger.warning(f"Erro no OCR em lote: {e}")
+        raise
+
+    # O Tesseract separa as páginas com form feed; a última separação é seguida de texto vazio
+    paginas = texto.split('\x0c')
+    if paginas and not paginas[-1].strip():
+        paginas.pop()
+    if len(paginas) != len(image_paths):
+        logger.warning(f"OCR em lote retornou {len(paginas)} páginas para {len(image_paths)} imagens")
+        raise ValueError("Saída do OCR em lote não corresponde às imagens de entrada")
+
+    return {str(path): pagina for path, pagina in zip(image_paths, paginas)}
+
+
+def _get_client(timeout=60):
+    """Retorna o cliente OpenAI compartilhado, criando-o na primeira chamada.
+
+    Reutilizar o cliente mantém o pool de conexões (keep-alive) entre os arquivos,
+    evitando um novo handshake TCP/TLS por documento.
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = OpenAI(
+            base_url=CONFIG['base_url_llm'],
+            api_key=CONFIG['api_key_llm'],
+            timeout=timeout,
+            max_retries=0,  # Retentativas controladas por _retry_llm
+        )
+    return _CLIENT
+
+
+def _get_async_client():
+    """Retorna o cliente AsyncOpenAI compartilhado, criando-o na primeira chamada."""
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        _ASYNC_CLIENT = AsyncOpenAI(
+            base_url=CONFIG['base_url_llm'],
+            api_key=CONFIG['api_key_llm'],
+            max_retries=0,  # Retentativas controladas por _retry_llm_async
+        )
+    return _ASYNC_CLIENT
+
+
+async def _fechar_async_client():
+    """Fecha o cliente AsyncOpenAI compartilhado, liberando o pool de conexões."""
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is not None:
+        await _ASYNC_CLIENT.close()
+        _ASYNC_CLIENT = None
+
+
+# Erros transitórios do LLM que justificam nova tentativa (429, 5xx, rede, timeout)
+_ERROS_TRANSITORIOS_LLM = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# Prefixos de modelos que aceitam response_format={"type": "json_object"}
+_MODELOS_JSON = ('gpt-4o', 'gpt-4.1', 'gpt-4-turbo', 'gpt-3.5-turbo', 'gpt-5')
+
+
+def _parametros_resposta(modelo):
+    """Parâmetros extras da chamada de chat: pede resposta em JSON quando o modelo suporta."""
+    if modelo.startswith(_MODELOS_JSON):
+        return {'response_format': {'type': 'json_object'}}
+    return {}
+
+
+_retry_llm = retry(
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type(_ERROS_TRANSITORIOS_LLM),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True,
+)
+
+
+@_retry_llm
+async def _do_chat_async(client, modelo, contexto, timeout=60):
+    """Executa a chamada de chat completion, repetindo em caso de erro transitório."""
+    return await client.chat.completions.create(
+        model=modelo,
+        messages=[
+            {"role": "user", "content": contexto}
+        ],
+        timeout=timeout,
+        **_parametros_resposta(modelo),
+    )
+
+
+def compactar_texto(texto, limite):
+    """Normaliza espaços, remove linhas vazias ou repetidas e limita o texto a ``limite`` caracteres.
+
+    O OCR costuma gerar muito espaço em branco e ruído repetido; menos tokens de entrada
+    deixam a resposta do LLM mais rápida e barata.
+    """
+    linhas = []
+    vistas = set()
+    for linha in texto.splitlines():
+        linha = ' '.join(linha.split())
+        if linha and linha not in vistas:
+            vistas.add(linha)
+            linhas.append(linha)
+    compacto = '\n'.join(linhas)
     
+    if len(compacto) > limite:
+        logger.info(f"Texto compactado com {len(compacto)} caracteres, truncando para {limite}")
+        compacto = compacto[:limite]
+    return compacto
+
+
+def montar_contexto(texto, prompt):
+    """Valida o texto extraído e monta o contexto enviado ao LLM."""
     # Validação de entrada
     if not texto or not texto.strip():
         raise ValueError("Texto vazio não pode ser enviado ao LLM")
     
-    if len(texto) > 100000:  # Limite de 100k caracteres
-        logger.warning(f"Texto muito longo ({len(texto)} caracteres), truncando para 100000")
-        texto = texto[:100000]
+    # 0 desativa o limite configurável; mantém-se o teto de 100k caracteres
+    limite = CONFIG['max_caracteres_contexto'] or 100000
+    texto = compactar_texto(texto, min(limite, 100000))
+    
+    return f"""{prompt}\n\n````\n{texto}\n````\n"""
+
+
+def validar_resposta_llm(resposta):
+    """Valida a resposta do LLM e retorna o conteúdo textual."""
+    if not resposta or not resposta.choices:
+        raise ValueError("Resposta vazia do LLM")
+    
+    resultado = resposta.choices[0].message.content
+    
+    if not resultado or not resultado.strip():
+        raise ValueError("Conteúdo vazio na resposta do LLM")
+    
+    logger.info("Resposta recebida do LLM e validada")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Resposta LLM: %s...", resultado[:200])
+    
+    return resultado
+
+
+async def enviar_para_llm_async(texto, prompt, modelo=None, timeout=60):
+    """Envia texto para um modelo de linguagem e retorna a resposta formatada."""
+    if modelo is None:
+        modelo = CONFIG['modelo_llm']
     
-    contexto = f"""{prompt}\n\n````\n{texto}\n````\n"""
+    contexto = montar_contexto(texto, prompt)
     
     try:
-        client = OpenAI(
-            base_url=CONFIG['base_url_llm'],
-            api_key=CONFIG['api_key_llm'],
-            timeout=timeout,
-        )
+        client = _get_async_client()
 
         logger.info(f"Enviando texto para LLM (modelo: {modelo}, timeout: {timeout}s)")
-        logger.debug(f"Tamanho do contexto: {len(contexto)} caracteres")
+        logger.debug("Tamanho do contexto: %d caracteres", len(contexto))
 
-        resposta = client.chat.completions.create(
-            model=modelo,
-            messages=[
-                {"role": "user", "content": contexto}
-            ]
-        )
-        
-        # Validação da resposta
-        if not resposta or not resposta.choices:
-            raise ValueError("Resposta vazia do LLM")
+        resposta = await _do_chat_async(client, modelo, contexto, timeout=timeout)
         
-        resultado = resposta.choices[0].message.content
-        
-        if not resultado or not resultado.strip():
-            raise ValueError("Conteúdo vazio na resposta do LLM")
-        
-        logger.info("Resposta recebida do LLM e validada")
-        logger.debug(f"Resposta LLM: {resultado[:200]}...")
-        
-        return resultado
+        return validar_resposta_llm(resposta)
     
     except Exception as e:
         logger.error(f"Erro ao comunicar com LLM: {e}")
@@ -377,7 +699,7 @@ def normalizar_codigos(codigos_raw):
     if isinstance(codigos_raw, list):
         elementos = codigos_raw
     else:
-        if pd.isna(codigos_raw):
+        if codigos_raw is None or (isinstance(codigos_raw, float) and math.isnan(codigos_raw)):
             return []
         try:
             texto = str(codigos_raw).strip()
@@ -395,25 +717,42 @@ def normalizar_codigos(codigos_raw):
     return [str(item).strip().lower() for item in elementos if str(item).strip()]
 
 
-def classifica_boleto(texto, dataframe):
-    """Classifica o boleto com base nos códigos presentes no dataframe."""
+def montar_regras(registros):
+    """Converte os registros normalizados nas regras de classificação.
+
+    Retorna um dicionário com 'itens', a lista de (nome_pagamento, códigos) montada uma única
+    vez, e 'automato', um autômato Aho-Corasick com todos os códigos (None se o pyahocorasick
+    não estiver instalado), que encontra todos os códigos presentes em uma única passada no texto.
+    """
+    # Regras sem códigos nunca casam; são descartadas aqui para não serem testadas a cada arquivo
+    itens = [(str(r['nome_pagamento']), tuple(r['codigos'])) for r in registros if r['codigos']]
+
+    automato = None
+    if ahocorasick is not None and itens:
+        automato = ahocorasick.Automaton()
+        for _, codigos in itens:
+            for codigo in codigos:
+                automato.add_word(codigo, codigo)
+        automato.make_automaton()
+        logger.debug(f"Autômato Aho-Corasick montado com {len(automato)} códigos")
+
+    return {'itens': itens, 'automato': automato}
+
+
+def classifica_boleto(texto, regras):
+    """Classifica o boleto com base nos códigos das regras (ver montar_regras)."""
     texto_lower = texto.lower()
     
-    for index, row in dataframe.iterrows():
-        try:
-            nome = str(row['nome_pagamento']) if pd.notna(row['nome_pagamento']) else 'naoidentificado'
-            codigos = row['codigos'] if isinstance(row['codigos'], list) else []
-            
-            if codigos and all(codigo in texto_lower for codigo in codigos):
-                logger.info(f"Boleto classificado como: {nome} (códigos: {', '.join(codigos)})")
-                return nome
-                
-        except KeyError as e:
-            logger.error(f"Coluna não encontrada no DataFrame: {e}")
-            raise
-        except Exception as e:
-            logger.warning(f"Erro ao processar linha {index} do DataFrame: {e}")
-            continue
+    if regras['automato'] is not None:
+        encontrados = {codigo for _, codigo in regras['automato'].iter(texto_lower)}
+        presente = encontrados.__contains__
+    else:
+        presente = texto_lower.__contains__
+    
+    for nome, codigos in regras['itens']:
+        if all(presente(codigo) for codigo in codigos):
+            logger.info(f"Boleto classificado como: {nome} (códigos: {', '.join(codigos)})")
+            return nome
     
     logger.info("Boleto não identificado - nenhum código encontrado")
     return 'naoidentificado'
@@ -471,7 +810,569 @@ def renomear_arquivo(origem, destino, dry_run=False):
         raise
 
 
-def main(path_arquivos, path_base_contas, modelo_override=None, dry_run=False, timeout=60):
+def _carregar_json(texto):
+    """Decodifica JSON usando orjson, se disponível, ou o módulo json."""
+    if orjson is not None:
+        return orjson.loads(texto)  # orjson.JSONDecodeError é subclasse de json.JSONDecodeError
+    return json.loads(texto)
+
+
+def _limpar_resposta(resposta):
+    """Remove artefatos de formatação comuns na resposta do LLM e isola o JSON."""
+    # Limpar resposta (remover chaves duplas se existirem)
+    resposta_limpa = resposta.replace('{{', '{').replace('}}', '}')
+    resposta_limpa = resposta_limpa.replace('\\"', '"')
+    resposta_limpa = _RE_ESC_UNDER.sub('_', resposta_limpa)
+
+    # Extrair JSON dentro de bloco de código markdown
+    match = _RE_JSON_BLOCK.search(resposta_limpa)
+    if match:
+        resposta_limpa = match.group(1)
+        logger.debug("Bloco JSON extraído: %s", resposta_limpa)
+    else:
+        resposta_limpa = resposta_limpa.strip()
+        logger.debug("Nenhum bloco JSON encontrado, usando resposta completa")
+    return resposta_limpa
+
+
+def concluir_processamento(arquivo, classificacao, resposta, path_arquivos, dry_run=False):
+    """Interpreta a resposta do LLM e renomeia o arquivo.
+
+    Retorna None em caso de sucesso ou um dicionário com 'arquivo' e 'erro' em caso de falha.
+    """
+    # Remover blocos de raciocínio entre tags <think>...</think>
+    resposta = _RE_THINK.sub('', resposta).strip()
+
+    # Caminho rápido: resposta já é um objeto JSON válido (ex.: response_format json_object)
+    try:
+        resposta_dict = _carregar_json(resposta)
+    except json.JSONDecodeError:
+        resposta_dict = None
+
+    if not isinstance(resposta_dict, dict):
+        resposta_limpa = _limpar_resposta(resposta)
+
+        if resposta_limpa.strip().lower() == 'erro':
+            erro_msg = f"LLM não conseguiu extrair informações"
+            logger.error(f"{erro_msg} de {arquivo}")
+            return {'arquivo': arquivo, 'erro': erro_msg}
+
+        try:
+            resposta_dict = _carregar_json(resposta_limpa)
+        except json.JSONDecodeError as e:
+            erro_msg = f"Erro ao decodificar JSON: {str(e)}"
+            logger.error(f"{erro_msg} para {arquivo}. Resposta: {resposta_limpa[:200]}...")
+            return {'arquivo': arquivo, 'erro': erro_msg}
+
+    # Em modo JSON (response_format json_object) o LLM não pode responder apenas 'erro'
+    if resposta_dict.get('erro') or (not resposta_dict.get('data_pagamento') and resposta_dict.get('valor_pagamento') is None):
+        erro_msg = f"LLM não conseguiu extrair informações"
+        logger.error(f"{erro_msg} de {arquivo}")
+        return {'arquivo': arquivo, 'erro': erro_msg}
+
+    # Extrair e validar dados
+    data_pagamento = (resposta_dict.get('data_pagamento') or '').strip()
+    valor_pagamento = resposta_dict.get('valor_pagamento')
+
+    if not data_pagamento or valor_pagamento is None:
+        erro_msg = f"Informações incompletas: data={data_pagamento}, valor={valor_pagamento}"
+        logger.error(f"{erro_msg} extraídas de {arquivo}")
+        return {'arquivo': arquivo, 'erro': erro_msg}
+
+    # Validar data
+    if not validar_data(data_pagamento):
+        erro_msg = f"Data inválida: {data_pagamento}"
+        logger.error(f"{erro_msg} extraída de {arquivo}")
+        return {'arquivo': arquivo, 'erro': erro_msg}
+
+    # Formatar valor
+    try:
+        valor_float = float(valor_pagamento)
+        # valor_formatado = f"{valor_float:.2f}".replace('.', ',')
+        valor_formatado = f"{valor_float:.2f}"
+    except (ValueError, TypeError) as e:
+        erro_msg = f"Valor inválido: {valor_pagamento} - {str(e)}"
+        logger.error(f"{erro_msg} extraído de {arquivo}")
+        return {'arquivo': arquivo, 'erro': erro_msg}
+
+    # Criar novo nome
+    extensao = Path(arquivo).suffix[1:]  # Remove o ponto
+    novo_nome = f"{data_pagamento}-R${valor_formatado}-{classificacao}.{extensao}"
+
+    # Renomear arquivo
+    origem = Path(path_arquivos) / arquivo
+    destino = Path(path_arquivos) / novo_nome
+
+    renomear_arquivo(origem, destino, dry_run=dry_run)
+
+    logger.info(f"✓ {arquivo} processado com sucesso -> {novo_nome}")
+    return None
+
+
+# Cache persistente de resultados (OCR e resposta do LLM) indexado pelo hash do conteúdo
+_NOME_CACHE = '.boleto_cache'
+
+
+def abrir_cache(path_arquivos, limpar=False):
+    """Abre (ou cria) o cache de resultados no diretório dos arquivos.
+
+    O cache é um shelve indexado pelo SHA-256 do conteúdo de cada arquivo, com as chaves
+    'ocr' (texto extraído), 'params_ocr' (idioma e pré-processamento usados no OCR),
+    'llm' (resposta do LLM), 'modelo' (modelo que gerou a resposta) e 'contexto'
+    (hash do prompt, do limite de caracteres e do texto enviados ao LLM).
+    Com ``limpar=True`` o cache existente é descartado.
+    """
+    caminho = Path(path_arquivos) / _NOME_CACHE
+    cache = shelve.open(str(caminho), flag='n' if limpar else 'c', writeback=False)
+    if limpar:
+        logger.info(f"Cache limpo: {caminho}")
+    else:
+        logger.info(f"Cache aberto com {len(cache)} entradas: {caminho}")
+    return cache
+
+
+def _gravar_cache(cache, chave, **campos):
+    """Atualiza a entrada ``chave`` do cache com os campos informados."""
+    if cache is None or not chave:
+        return
+    entrada = dict(cache.get(chave, {}))
+    entrada.update(campos)
+    cache[chave] = entrada
+
+
+def _ler_cache(cache, chave):
+    """Retorna a entrada ``chave`` do cache, ou um dicionário vazio."""
+    if cache is None or not chave:
+        return {}
+    return cache.get(chave, {})
+
+
+def _parametros_ocr():
+    """Configurações que alteram o texto extraído, gravadas junto com ele no cache."""
+    return {'tesseract_lang': CONFIG['tesseract_lang'], 'preprocessar_ocr': CONFIG['preprocessar_ocr']}
+
+
+def _ocr_em_cache(cache, chave):
+    """Retorna o texto extraído em cache para o arquivo, se obtido com as mesmas configurações de OCR."""
+    entrada = _ler_cache(cache, chave)
+    if entrada.get('params_ocr') == _parametros_ocr():
+        return entrada.get('ocr')
+    return None
+
+
+def _hash_contexto(conteudo):
+    """Hash do que determina a resposta do LLM além do modelo: prompt, limite de caracteres e texto."""
+    h = hashlib.sha256()
+    for parte in (PROMPT, str(CONFIG['max_caracteres_contexto']), conteudo):
+        h.update(parte.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def hash_arquivo(path):
+    """Calcula o SHA-256 do conteúdo de um arquivo, lendo-o em blocos (memória constante)."""
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        digest = hashlib.sha256()
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(bloco)
+        return digest.hexdigest()
+
+
+async def calcular_chaves(arquivos, path_arquivos):
+    """Calcula (em threads) o hash de conteúdo de cada arquivo, usado como chave do cache."""
+    hashes = await asyncio.gather(
+        *(asyncio.to_thread(hash_arquivo, Path(path_arquivos) / arquivo) for arquivo in arquivos),
+        return_exceptions=True,
+    )
+    chaves = {}
+    for arquivo, chave in zip(arquivos, hashes):
+        if isinstance(chave, Exception):
+            logger.warning(f"Não foi possível calcular o hash de {arquivo}, cache desativado para ele: {chave}")
+            continue
+        chaves[arquivo] = chave
+    return chaves
+
+
+# Limite de imagens por execução do Tesseract com arquivo de lista (listas longas podem travar)
+_MAX_IMAGENS_POR_LISTA = 50
+# Mínimo de imagens por grupo, para que cada inicialização do Tesseract sirva a mais de uma imagem
+_MIN_IMAGENS_POR_LISTA = 4
+
+
+def agendar_ocr_em_lote(arquivos, path_arquivos, workers=None):
+    """Agenda o OCR das imagens em grupos de até _MAX_IMAGENS_POR_LISTA por execução do Tesseract.
+
+    As imagens são divididas em até ``workers`` grupos, para que as threads de extração
+    tenham execuções do Tesseract em andamento, mas cada grupo tem ao menos
+    _MIN_IMAGENS_POR_LISTA imagens (exceto o último), para que a inicialização seja
+    amortizada. Só se aplica ao OCR via pytesseract sem pré-processamento; com tesserocr
+    o modelo já é carregado uma única vez por thread. Retorna um dicionário
+    arquivo -> tarefa que resolve para o resultado de extract_text_from_images do grupo.
+    """
+    if PyTessBaseAPI is not None or CONFIG['preprocessar_ocr']:
+        return {}
+
+    imagens = [
+        arquivo for arquivo in arquivos
+        if os.path.splitext(arquivo)[1].lower() in ('.jpg', '.jpeg', '.png') and '\n' not in arquivo
+    ]
+    if len(imagens) < 2:
+        return {}
+
+    workers = workers or os.cpu_count() or 1
+    tamanho_grupo = min(_MAX_IMAGENS_POR_LISTA, max(_MIN_IMAGENS_POR_LISTA, math.ceil(len(imagens) / workers)))
+    tarefas = {}
+    for inicio in range(0, len(imagens), tamanho_grupo):
+        grupo = imagens[inicio:inicio + tamanho_grupo]
+        caminhos = [Path(path_arquivos) / arquivo for arquivo in grupo]
+        tarefa = asyncio.ensure_future(asyncio.to_thread(extract_text_from_images, caminhos))
+        for arquivo in grupo:
+            tarefas[arquivo] = tarefa
+    return tarefas
+
+
+async def preparar_arquivo(arquivo, path_arquivos, regras, ocr_em_lote=None, cache=None, chave=None):
+    """Extrai o conteúdo de um arquivo (em uma thread) e classifica o boleto.
+
+    Se o texto do arquivo (identificado por ``chave``) estiver no cache, a extração é pulada.
+    Se ``ocr_em_lote`` for informado (tarefa de agendar_ocr_em_lote), o texto é obtido do OCR
+    em lote, recaindo na extração individual se o lote falhar.
+    Retorna a tupla (conteudo, classificacao, erro), onde erro é None em caso de sucesso
+    ou um dicionário com 'arquivo' e 'erro' quando nenhum conteúdo foi extraído.
+    """
+    logger.info(f"Processando arquivo: {arquivo}")
+    
+    # Extrair conteúdo
+    arquivo_path = Path(path_arquivos) / arquivo
+    conteudo = _ocr_em_cache(cache, chave)
+    do_cache = conteudo is not None
+    if do_cache:
+        logger.info(f"Conteúdo de {arquivo} obtido do cache")
+    elif ocr_em_lote is not None:
+        try:
+            conteudo = (await ocr_em_lote).get(str(arquivo_path))
+        except Exception as e:
+            logger.debug("OCR em lote indisponível para %s (%s), extraindo individualmente", arquivo, e)
+    if conteudo is None:
+        conteudo = await asyncio.to_thread(extract_content, arquivo_path)
+    if not do_cache and conteudo.strip():
+        _gravar_cache(cache, chave, ocr=conteudo, params_ocr=_parametros_ocr())
+    
+    if not conteudo.strip():
+        erro_msg = f"Nenhum conteúdo extraído de {arquivo}"
+        logger.error(erro_msg)
+        return conteudo, None, {'arquivo': arquivo, 'erro': erro_msg}
+    
+    # Classificar boleto
+    classificacao = classifica_boleto(conteudo, regras)
+    return conteudo, classificacao, None
+
+
+def _erro_inesperado(arquivo, e):
+    """Registra um erro inesperado no processamento de um arquivo e retorna o dicionário de erro."""
+    erro_msg = f"Erro inesperado: {str(e)}"
+    logger.error(f"✗ {erro_msg} ao processar {arquivo}", exc_info=True)
+    return {'arquivo': arquivo, 'erro': erro_msg}
+
+
+def _resposta_em_cache(cache, chave, modelo, hash_contexto):
+    """Retorna a resposta do LLM em cache para o arquivo, se gerada pelo mesmo modelo e contexto."""
+    entrada = _ler_cache(cache, chave)
+    if entrada.get('llm') and entrada.get('modelo') == modelo and entrada.get('contexto') == hash_contexto:
+        return entrada['llm']
+    return None
+
+
+def concluir_com_cache(arquivo, classificacao, resposta, path_arquivos, modelo, dry_run=False,
+                       cache=None, chave=None, do_cache=False, hash_contexto=None):
+    """Conclui o processamento e, em caso de sucesso, grava no cache a resposta obtida do LLM.
+
+    Respostas que não puderam ser interpretadas não são gravadas, para que sejam refeitas
+    na próxima execução. Em dry-run a resposta também não é gravada, para que uma execução
+    real não renomeie arquivos a partir de uma simulação.
+    """
+    if do_cache:
+        logger.info(f"Resposta do LLM para {arquivo} obtida do cache")
+    resultado = concluir_processamento(arquivo, classificacao, resposta, path_arquivos, dry_run=dry_run)
+    if resultado is None and not do_cache and not dry_run:
+        _gravar_cache(cache, chave, llm=resposta, modelo=modelo, contexto=hash_contexto)
+    return resultado
+
+
+async def consultar_e_concluir(arquivo, conteudo, classificacao, sem, path_arquivos, modelo, timeout, dry_run=False,
+                               cache=None, chave=None):
+    """Envia o conteúdo ao LLM (limitado pelo semáforo ``sem``) e conclui o processamento do arquivo.
+
+    Se houver resposta em cache para o arquivo e o modelo, a chamada ao LLM é pulada.
+    """
+    try:
+        hash_contexto = _hash_contexto(conteudo) if cache is not None else None
+        resposta = _resposta_em_cache(cache, chave, modelo, hash_contexto)
+        do_cache = resposta is not None
+        if not do_cache:
+            async with sem:
+                resposta = await enviar_para_llm_async(conteudo, PROMPT, modelo, timeout=timeout)
+
+        return concluir_com_cache(arquivo, classificacao, resposta, path_arquivos, modelo, dry_run=dry_run,
+                                  cache=cache, chave=chave, do_cache=do_cache, hash_contexto=hash_contexto)
+    except Exception as e:
+        return _erro_inesperado(arquivo, e)
+
+
+async def processar_arquivo(arquivo, sem, path_arquivos, regras, modelo, timeout, dry_run=False, ocr_em_lote=None,
+                            cache=None, chave=None):
+    """Processa um único arquivo: extrai o conteúdo, classifica, consulta o LLM e renomeia.
+
+    A extração roda em uma thread para não bloquear o event loop e a chamada ao LLM
+    é limitada pelo semáforo ``sem``. Retorna None em caso de sucesso ou um dicionário
+    com 'arquivo' e 'erro' em caso de falha.
+    """
+    try:
+        conteudo, classificacao, erro = await preparar_arquivo(
+            arquivo, path_arquivos, regras, ocr_em_lote, cache=cache, chave=chave
+        )
+    except Exception as e:
+        return _erro_inesperado(arquivo, e)
+    if erro:
+        return erro
+
+    return await consultar_e_concluir(
+        arquivo, conteudo, classificacao, sem, path_arquivos, modelo, timeout, dry_run=dry_run,
+        cache=cache, chave=chave
+    )
+
+
+def _configurar_executor(workers=None):
+    """Define o pool de threads usado pelo event loop para a extração (OCR/PDF).
+
+    O Tesseract libera o GIL durante o OCR, então threads bastam para usar todos os
+    núcleos. O PyMuPDF não é thread-safe e é serializado por ``_FITZ_LOCK``; a extração
+    de texto de PDFs é rápida perto do OCR.
+    """
+    workers = workers or os.cpu_count() or 1
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr')
+    )
+    logger.info(f"Extração de conteúdo com até {workers} threads")
+
+
+def _sem_ocr_em_cache(arquivos, cache, chaves):
+    """Filtra os arquivos cujo texto extraído ainda não está no cache."""
+    return [arquivo for arquivo in arquivos if _ocr_em_cache(cache, chaves.get(arquivo)) is None]
+
+
+def _coletar_erros(arquivos, resultados):
+    """Converte os resultados do asyncio.gather na lista de arquivos com erro."""
+    arquivos_com_erro = []
+    for arquivo, resultado in zip(arquivos, resultados):
+        if isinstance(resultado, BaseException):
+            resultado = {'arquivo': arquivo, 'erro': f"Erro inesperado: {str(resultado)}"}
+        if resultado:
+            arquivos_com_erro.append(resultado)
+    return arquivos_com_erro
+
+
+async def processar_arquivos(arquivos, path_arquivos, regras, modelo, timeout, dry_run=False, concurrency=8, workers=None,
+                             cache=None):
+    """Processa todos os arquivos concorrentemente, com no máximo ``concurrency`` chamadas simultâneas ao LLM
+    e ``workers`` threads de extração."""
+    _configurar_executor(workers)
+    sem = asyncio.Semaphore(concurrency)
+    chaves = await calcular_chaves(arquivos, path_arquivos) if cache is not None else {}
+    ocr_em_lote = agendar_ocr_em_lote(_sem_ocr_em_cache(arquivos, cache, chaves), path_arquivos, workers)
+    tasks = [
+        processar_arquivo(arquivo, sem, path_arquivos, regras, modelo, timeout, dry_run=dry_run,
+                          ocr_em_lote=ocr_em_lote.get(arquivo), cache=cache, chave=chaves.get(arquivo))
+        for arquivo in arquivos
+    ]
+    try:
+        resultados = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await _fechar_async_client()
+
+    return _coletar_erros(arquivos, resultados)
+
+
+@_retry_llm
+def _consultar_lote(client, id_lote):
+    """Consulta o status de um lote, repetindo em caso de erro transitório."""
+    return client.batches.retrieve(id_lote)
+
+
+@_retry_llm
+def _baixar_arquivo(client, file_id):
+    """Baixa o conteúdo textual de um arquivo do provedor, repetindo em caso de erro transitório."""
+    return client.files.content(file_id).text
+
+
+def _enviar_lote(client, contextos, modelo):
+    """Grava os contextos em JSONL, envia o arquivo e cria o lote na Batch API."""
+    fd, caminho_lote = tempfile.mkstemp(prefix='boleto_batch_', suffix='.jsonl')
+    _temp_files.append(caminho_lote)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for custom_id, contexto in contextos.items():
+            linha = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": modelo,
+                    "messages": [{"role": "user", "content": contexto}],
+                    **_parametros_resposta(modelo),
+                },
+            }
+            f.write(json.dumps(linha, ensure_ascii=False) + '\n')
+
+    with open(caminho_lote, 'rb') as f:
+        arquivo_lote = client.files.create(file=f, purpose='batch')
+    return client.batches.create(
+        input_file_id=arquivo_lote.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+
+
+def enviar_lote_para_llm(contextos, modelo, timeout=60, intervalo_consulta=30):
+    """Envia os contextos pela Batch API (/v1/batches) e aguarda o resultado.
+
+    ``contextos`` mapeia custom_id (nome do arquivo) para o contexto já montado.
+    Se ``CONFIG['id_lote']`` estiver definido, retoma a consulta desse lote em vez de enviar um novo.
+    Retorna um dicionário custom_id -> conteúdo da resposta (ou Exception em caso de erro
+    naquela requisição), ou None se o provedor não suportar a Batch API (ex.: Ollama).
+    """
+    client = _get_client(timeout)
+
+    if CONFIG['id_lote']:
+        lote = _consultar_lote(client, CONFIG['id_lote'])
+        logger.info(f"Retomando lote {lote.id} ({lote.status})")
+    else:
+        try:
+            lote = _enviar_lote(client, contextos, modelo)
+        except APIStatusError as e:
+            if e.status_code in (404, 405, 501):
+                logger.warning(f"Batch API não suportada pelo provedor LLM ({e.status_code}), usando modo interativo")
+                return None
+            raise
+
+        logger.warning(f"Lote {lote.id} enviado com {len(contextos)} requisições (modelo: {modelo}); "
+                       f"se a execução for interrompida, retome com --batch-id {lote.id}")
+
+    while lote.status not in ('completed', 'failed', 'expired', 'cancelled'):
+        time.sleep(intervalo_consulta)
+        lote = _consultar_lote(client, lote.id)
+        contagem = lote.request_counts
+        if contagem:
+            logger.info(f"Lote {lote.id}: {lote.status} ({contagem.completed}/{contagem.total} concluídas)")
+        else:
+            logger.info(f"Lote {lote.id}: {lote.status}")
+
+    if lote.status != 'completed':
+        raise RuntimeError(f"Lote {lote.id} terminou com status '{lote.status}'")
+
+    resultados = {}
+    for file_id in (lote.output_file_id, lote.error_file_id):
+        if not file_id:
+            continue
+        for linha in _baixar_arquivo(client, file_id).splitlines():
+            if not linha.strip():
+                continue
+            item = json.loads(linha)
+            custom_id = item.get('custom_id')
+            response = item.get('response') or {}
+            try:
+                if item.get('error'):
+                    raise ValueError(f"Erro no lote: {item['error']}")
+                if response.get('status_code') != 200:
+                    raise ValueError(f"Erro no lote (HTTP {response.get('status_code')}): {response.get('body')}")
+                resultados[custom_id] = validar_resposta_llm(ChatCompletion.model_validate(response['body']))
+            except Exception as e:
+                resultados[custom_id] = e
+
+    return resultados
+
+
+async def processar_arquivos_lote(arquivos, path_arquivos, regras, modelo, timeout, dry_run=False, concurrency=8, workers=None,
+                                  cache=None):
+    """Processa os arquivos usando a Batch API do provedor LLM.
+
+    Extrai e classifica todos os arquivos, envia um único lote ao LLM e conclui cada arquivo
+    com a resposta correspondente. Se o provedor não suportar a Batch API, recai no
+    processamento interativo concorrente.
+    """
+    _configurar_executor(workers)
+    chaves = await calcular_chaves(arquivos, path_arquivos) if cache is not None else {}
+    ocr_em_lote = agendar_ocr_em_lote(_sem_ocr_em_cache(arquivos, cache, chaves), path_arquivos, workers)
+    preparados = await asyncio.gather(
+        *(preparar_arquivo(arquivo, path_arquivos, regras, ocr_em_lote.get(arquivo), cache=cache, chave=chaves.get(arquivo))
+          for arquivo in arquivos),
+        return_exceptions=True,
+    )
+
+    resultados = {}
+    pendentes = {}
+    for arquivo, preparado in zip(arquivos, preparados):
+        if isinstance(preparado, Exception):
+            resultados[arquivo] = _erro_inesperado(arquivo, preparado)
+            continue
+        conteudo, classificacao, erro = preparado
+        if erro:
+            resultados[arquivo] = erro
+            continue
+        hash_contexto = _hash_contexto(conteudo) if cache is not None else None
+        resposta = _resposta_em_cache(cache, chaves.get(arquivo), modelo, hash_contexto)
+        if resposta is not None:
+            try:
+                resultados[arquivo] = concluir_com_cache(arquivo, classificacao, resposta, path_arquivos, modelo,
+                                                         dry_run=dry_run, do_cache=True)
+            except Exception as e:
+                resultados[arquivo] = _erro_inesperado(arquivo, e)
+            continue
+        pendentes[arquivo] = (conteudo, classificacao, hash_contexto)
+
+    if pendentes:
+        respostas = None
+        try:
+            contextos = {arquivo: montar_contexto(conteudo, PROMPT) for arquivo, (conteudo, _, _) in pendentes.items()}
+            respostas = await asyncio.to_thread(enviar_lote_para_llm, contextos, modelo, timeout)
+        except Exception as e:
+            logger.error(f"Erro ao processar lote no LLM: {e}")
+            for arquivo in pendentes:
+                resultados[arquivo] = {'arquivo': arquivo, 'erro': f"Erro no lote: {str(e)}"}
+            pendentes = {}
+
+        if respostas is None and pendentes:
+            # Provedor sem Batch API: recai no modo interativo
+            sem = asyncio.Semaphore(concurrency)
+            try:
+                interativos = await asyncio.gather(*(
+                    consultar_e_concluir(arquivo, conteudo, classificacao, sem, path_arquivos, modelo, timeout, dry_run=dry_run,
+                                         cache=cache, chave=chaves.get(arquivo))
+                    for arquivo, (conteudo, classificacao, _) in pendentes.items()
+                ), return_exceptions=True)
+            finally:
+                await _fechar_async_client()
+            resultados.update(zip(pendentes, interativos))
+        else:
+            for arquivo, (_, classificacao, hash_contexto) in pendentes.items():
+                resposta = respostas.get(arquivo)
+                try:
+                    if resposta is None:
+                        raise ValueError("Resposta ausente no resultado do lote")
+                    if isinstance(resposta, Exception):
+                        raise resposta
+                    resultados[arquivo] = concluir_com_cache(arquivo, classificacao, resposta, path_arquivos, modelo,
+                                                             dry_run=dry_run, cache=cache, chave=chaves.get(arquivo),
+                                                             hash_contexto=hash_contexto)
+                except Exception as e:
+                    resultados[arquivo] = _erro_inesperado(arquivo, e)
+
+    return _coletar_erros(arquivos, [resultados.get(arquivo) for arquivo in arquivos])
+
+
+def main(path_arquivos, path_base_contas, modelo_override=None, dry_run=False, timeout=60, concurrency=8, batch=False,
+         workers=None, usar_cache=True, limpar_cache=False):
     """Função principal para processar e renomear arquivos de comprovantes de pagamento."""
     
     # Validação de entrada
@@ -484,6 +1385,15 @@ def main(path_arquivos, path_base_contas, modelo_override=None, dry_run=False, t
     if timeout <= 0:
         raise ValueError("timeout deve ser maior que zero")
     
+    if concurrency <= 0:
+        raise ValueError("concurrency deve ser maior que zero")
+    
+    if workers is not None and workers <= 0:
+        raise ValueError("workers deve ser maior que zero")
+    
+    if CONFIG['max_caracteres_contexto'] < 0:
+        raise ValueError("max_caracteres_contexto deve ser maior ou igual a zero")
+    
     # Verificar dependências
     verificar_dependencias()
     
@@ -497,9 +1407,11 @@ def main(path_arquivos, path_base_contas, modelo_override=None, dry_run=False, t
         raise FileNotFoundError(f"Arquivo CSV não encontrado: {path_base_contas}")
     
     try:
-        df = carregar_base_contas(path_base_contas)
-        validar_dataframe(df)
-        df['codigos'] = df['codigos'].apply(normalizar_codigos)
+        registros = carregar_base_contas(path_base_contas)
+        validar_registros(registros)
+        for r in registros:
+            r['codigos'] = normalizar_codigos(r['codigos'])
+        regras = montar_regras(registros)
     except Exception as e:
         logger.error(f"Erro ao carregar CSV {path_base_contas}: {e}")
         raise
@@ -518,116 +1430,30 @@ def main(path_arquivos, path_base_contas, modelo_override=None, dry_run=False, t
         logger.info(f"Nenhum arquivo será realmente renomeado")
         logger.info(f"===========================")
     
+    batch = batch or bool(CONFIG['id_lote'])
+    if batch:
+        logger.info("Modo lote (Batch API) ativado")
+    
     logger.info(f"Iniciando processamento de {len(arquivos)} arquivos com modelo {modelo_atual}")
 
-    sucessos = 0
-    erros = 0
-    arquivos_com_erro = []
-
-    for arquivo in arquivos:
-        logger.info(f"Processando arquivo: {arquivo}")
-        
-        try:
-            # Extrair conteúdo
-            arquivo_path = Path(path_arquivos) / arquivo
-            conteudo = extract_content(arquivo_path)
-            
-            if not conteudo.strip():
-                erro_msg = f"Nenhum conteúdo extraído de {arquivo}"
-                logger.error(erro_msg)
-                arquivos_com_erro.append({'arquivo': arquivo, 'erro': erro_msg})
-                erros += 1
-                continue
-            
-            # Classificar boleto
-            classificacao = classifica_boleto(conteudo, df)
-            
-            # Enviar para LLM
-            resposta = enviar_para_llm(conteudo, PROMPT, modelo_atual, timeout=timeout)
-
-            # Remover blocos de raciocínio entre tags <think>...</think>
-            resposta = re.sub(r'<think>[\s\S]*?</think>', '', resposta, flags=re.IGNORECASE).strip()
-            
-            # Limpar resposta (remover chaves duplas se existirem)
-            resposta_limpa = resposta.replace('{{', '{').replace('}}', '}')
-            resposta_limpa = resposta_limpa.replace('\\"', '"')
-            resposta_limpa = re.sub(r'\\_', '_', resposta_limpa)
-            # print("resposta_limpa",resposta_limpa)
-
-            # Extrair JSON dentro de bloco de código markdown
-            match = re.search(r"```json\s*(\{[\s\S]*?\})\s*```", resposta_limpa)
-            if match:
-                resposta_limpa = match.group(1)
-                logger.debug(f"Bloco JSON extraído: {resposta_limpa}")
-            else:
-                resposta_limpa = resposta_limpa.strip()
-                logger.debug("Nenhum bloco JSON encontrado, usando resposta completa")
-
-            if resposta_limpa.strip().lower() == 'erro':
-                erro_msg = f"LLM não conseguiu extrair informações"
-                logger.error(f"{erro_msg} de {arquivo}")
-                arquivos_com_erro.append({'arquivo': arquivo, 'erro': erro_msg})
-                erros += 1
-                continue
+    cache = None
+    if usar_cache or limpar_cache:
+        cache = abrir_cache(path_arquivos, limpar=limpar_cache)
+        if not usar_cache:
+            cache.close()
+            cache = None
 
-            try:
-                resposta_dict = json.loads(resposta_limpa)
-            except json.JSONDecodeError as e:
-                erro_msg = f"Erro ao decodificar JSON: {str(e)}"
-                logger.error(f"{erro_msg} para {arquivo}. Resposta: {resposta_limpa[:200]}...")
-                arquivos_com_erro.append({'arquivo': arquivo, 'erro': erro_msg})
-                erros += 1
-                continue
-            
-            # Extrair e validar dados
-            data_pagamento = resposta_dict.get('data_pagamento', '').strip()
-            valor_pagamento = resposta_dict.get('valor_pagamento')
-            
-            if not data_pagamento or valor_pagamento is None:
-                erro_msg = f"Informações incompletas: data={data_pagamento}, valor={valor_pagamento}"
-                logger.error(f"{erro_msg} extraídas de {arquivo}")
-                arquivos_com_erro.append({'arquivo': arquivo, 'erro': erro_msg})
-                erros += 1
-                continue
-            
-            # Validar data
-            if not validar_data(data_pagamento):
-                erro_msg = f"Data inválida: {data_pagamento}"
-                logger.error(f"{erro_msg} extraída de {arquivo}")
-                arquivos_com_erro.append({'arquivo': arquivo, 'erro': erro_msg})
-                erros += 1
-                continue
-            
-            # Formatar valor
-            try:
-                valor_float = float(valor_pagamento)
-                # valor_formatado = f"{valor_float:.2f}".replace('.', ',')
-                valor_formatado = f"{valor_float:.2f}"
-            except (ValueError, TypeError) as e:
-                erro_msg = f"Valor inválido: {valor_pagamento} - {str(e)}"
-                logger.error(f"{erro_msg} extraído de {arquivo}")
-                arquivos_com_erro.append({'arquivo': arquivo, 'erro': erro_msg})
-                erros += 1
-                continue
-            
-            # Criar novo nome
-            extensao = Path(arquivo).suffix[1:]  # Remove o ponto
-            novo_nome = f"{data_pagamento}-R${valor_formatado}-{classificacao}.{extensao}"
-            
-            # Renomear arquivo
-            origem = Path(path_arquivos) / arquivo
-            destino = Path(path_arquivos) / novo_nome
-            
-            renomear_arquivo(origem, destino, dry_run=dry_run)
-            sucessos += 1
-            
-            logger.info(f"✓ {arquivo} processado com sucesso -> {novo_nome}")
-            
-        except Exception as e:
-            erro_msg = f"Erro inesperado: {str(e)}"
-            logger.error(f"✗ {erro_msg} ao processar {arquivo}", exc_info=True)
-            arquivos_com_erro.append({'arquivo': arquivo, 'erro': erro_msg})
-            erros += 1
+    processar = processar_arquivos_lote if batch else processar_arquivos
+    try:
+        arquivos_com_erro = asyncio.run(
+            processar(arquivos, path_arquivos, regras, modelo_atual, timeout, dry_run=dry_run, concurrency=concurrency,
+                      workers=workers, cache=cache)
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+    erros = len(arquivos_com_erro)
+    sucessos = len(arquivos) - erros
 
     logger.info(f"Processamento concluído: {sucessos} sucessos, {erros} erros")
     
@@ -651,6 +1477,12 @@ Variáveis de ambiente suportadas:
   BOLETO_API_KEY_LLM      Chave API do LLM (padrão: ollama)
   BOLETO_TESSERACT_LANG   Idioma do Tesseract OCR (padrão: por)
   BOLETO_LOG_LEVEL        Nível de log: DEBUG, INFO, WARNING, ERROR (padrão: INFO)
+  BOLETO_PREPROCESS_OCR   Pré-processar imagens com OpenCV antes do OCR: 1/true (padrão: desativado)
+  BOLETO_TAMANHO_MIN_ARQUIVO  Tamanho mínimo em bytes de um arquivo (padrão: 512; 0 desativa)
+  BOLETO_TAMANHO_MAX_ARQUIVO  Tamanho máximo em bytes de um arquivo (padrão: 20000000; 0 desativa)
+  BOLETO_MAX_PAGINAS_PDF      Número máximo de páginas de um PDF (padrão: 10; 0 desativa)
+  BOLETO_DIMENSAO_MIN_IMAGEM  Largura/altura mínima em pixels de uma imagem (padrão: 100; 0 desativa)
+  BOLETO_MAX_CONTEXT_CHARS    Máximo de caracteres do texto enviado ao LLM (padrão: 4000)
 
 Exemplos:
   python boleto_extract.py --path_arquivos /caminho/dos/pdfs --path_base_contas contas.csv
@@ -690,6 +1522,43 @@ Exemplos:
         help='Idioma do Tesseract OCR (sobrescreve BOLETO_TESSERACT_LANG)'
     )
     
+    parser.add_argument(
+        '--preprocess', 
+        action='store_true',
+        help='Pré-processa imagens com OpenCV (tons de cinza + limiar adaptativo) antes do OCR'
+    )
+    
+    parser.add_argument(
+        '--tamanho-min-arquivo', 
+        type=int,
+        help='Tamanho mínimo em bytes para processar um arquivo; 0 desativa (sobrescreve BOLETO_TAMANHO_MIN_ARQUIVO)'
+    )
+    
+    parser.add_argument(
+        '--tamanho-max-arquivo', 
+        type=int,
+        help='Tamanho máximo em bytes para processar um arquivo; 0 desativa (sobrescreve BOLETO_TAMANHO_MAX_ARQUIVO)'
+    )
+    
+    parser.add_argument(
+        '--max-paginas-pdf', 
+        type=int,
+        help='Número máximo de páginas de um PDF; 0 desativa (sobrescreve BOLETO_MAX_PAGINAS_PDF)'
+    )
+    
+    parser.add_argument(
+        '--dimensao-min-imagem', 
+        type=int,
+        help='Largura/altura mínima em pixels de uma imagem; 0 desativa (sobrescreve BOLETO_DIMENSAO_MIN_IMAGEM)'
+    )
+    
+    parser.add_argument(
+        '--max-context-chars', 
+        type=int,
+        help='Máximo de caracteres do texto enviado ao LLM após compactação; 0 usa o teto de 100000 '
+             '(sobrescreve BOLETO_MAX_CONTEXT_CHARS, padrão: 4000)'
+    )
+    
     parser.add_argument(
         '--log-level', 
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
@@ -703,10 +1572,48 @@ Exemplos:
         help='Timeout em segundos para chamadas ao LLM (padrão: 60)'
     )
     
+    parser.add_argument(
+        '--concurrency', 
+        type=int,
+        default=8,
+        help='Número máximo de chamadas simultâneas ao LLM (padrão: 8)'
+    )
+    
+    parser.add_argument(
+        '--workers', 
+        type=int,
+        default=os.cpu_count(),
+        help='Número de threads para extração de conteúdo/OCR (padrão: número de CPUs)'
+    )
+    
+    parser.add_argument(
+        '--batch', 
+        action='store_true',
+        help='Envia todos os arquivos em um único lote pela Batch API do provedor LLM (mais barato, não interativo)'
+    )
+    
+    parser.add_argument(
+        '--batch-id', 
+        type=str,
+        help='Retoma um lote já enviado à Batch API em vez de enviar um novo (implica --batch)'
+    )
+    
+    parser.add_argument(
+        '--no-cache', 
+        action='store_true',
+        help='Não usa o cache de resultados (OCR e LLM) por hash de conteúdo'
+    )
+    
+    parser.add_argument(
+        '--clear-cache', 
+        action='store_true',
+        help='Descarta o cache de resultados antes de processar'
+    )
+    
     parser.add_argument(
         '--dry-run', 
         action='store_true',
-        help='Executa sem renomear arquivos (apenas simula)'
+        help='Executa sem renomear arquivos (apenas simula; só o texto extraído é guardado no cache)'
     )
 
     args = parser.parse_args()
@@ -721,6 +1628,20 @@ Exemplos:
             CONFIG['api_key_llm'] = args.api_key_llm
         if args.tesseract_lang:
             CONFIG['tesseract_lang'] = args.tesseract_lang
+        if args.preprocess:
+            CONFIG['preprocessar_ocr'] = True
+        if args.tamanho_min_arquivo is not None:
+            CONFIG['tamanho_min_arquivo'] = args.tamanho_min_arquivo
+        if args.tamanho_max_arquivo is not None:
+            CONFIG['tamanho_max_arquivo'] = args.tamanho_max_arquivo
+        if args.max_paginas_pdf is not None:
+            CONFIG['max_paginas_pdf'] = args.max_paginas_pdf
+        if args.dimensao_min_imagem is not None:
+            CONFIG['dimensao_min_imagem'] = args.dimensao_min_imagem
+        if args.max_context_chars is not None:
+            CONFIG['max_caracteres_contexto'] = args.max_context_chars
+        if args.batch_id:
+            CONFIG['id_lote'] = args.batch_id
         if args.log_level:
             CONFIG['log_level'] = args.log_level
             # Atualizar nível do logger
@@ -738,7 +1659,9 @@ Exemplos:
                 logger.info(f"{key}: {value}")
         logger.info("==================")
 
-        main(args.path_arquivos, args.path_base_contas, args.modelo, dry_run=args.dry_run, timeout=args.timeout)
+        main(args.path_arquivos, args.path_base_contas, args.modelo, dry_run=args.dry_run, timeout=args.timeout,
+             concurrency=args.concurrency, batch=args.batch,
+             workers=args.workers, usar_cache=not args.no_cache, limpar_cache=args.clear_cache)
         
     except KeyboardInterrupt:
         logger.info("Processamento interrompido pelo usuário")